@@ -6,28 +6,43 @@ Import and use these functions in your API endpoints for database operations.
 """
 
 from pymongo import MongoClient
+from pymongo.errors import BulkWriteError
+from bson import ObjectId
 from datetime import datetime, timezone
+import asyncio
+import logging
 import os
 from dotenv import load_dotenv
-from typing import Union
+from typing import Callable, List, Optional, Union
 from pydantic import BaseModel
 
+logger = logging.getLogger(__name__)
+
 # Load environment variables from .env file
 load_dotenv()
 
 _client = None
 db = None
+_async_client = None
+_async_db = None
 
 database_url = os.getenv("DATABASE_URL")
 database_name = os.getenv("DATABASE_NAME")
 
-if database_url and database_name:
-    _client = MongoClient(database_url)
-    db = _client[database_name]
+def get_db():
+    """Return the pymongo database handle, creating the client on first use"""
+    global _client, db
+    # Created lazily so a preloading server (gunicorn --preload) doesn't fork
+    # the client's monitor threads into its workers
+    if db is None and database_url and database_name:
+        _client = MongoClient(database_url)
+        db = _client[database_name]
+    return db
 
 # Helper functions for common database operations
 def create_document(collection_name: str, data: Union[BaseModel, dict]):
     """Insert a single document with timestamp"""
+    db = get_db()
     if db is None:
         raise Exception("Database not available. Check DATABASE_URL and DATABASE_NAME environment variables.")
 
@@ -45,6 +60,7 @@ def create_document(collection_name: str, data: Union[BaseModel, dict]):
 
 def get_documents(collection_name: str, filter_dict: dict = None, limit: int = None):
     """Get documents from collection"""
+    db = get_db()
     if db is None:
         raise Exception("Database not available. Check DATABASE_URL and DATABASE_NAME environment variables.")
     
@@ -53,3 +69,157 @@ def get_documents(collection_name: str, filter_dict: dict = None, limit: int = N
         cursor = cursor.limit(limit)
     
     return list(cursor)
+
+def get_async_db():
+    """Return the Motor database handle, creating the client on first use"""
+    global _async_client, _async_db
+    if _async_db is None and database_url and database_name:
+        # Imported lazily so module import (and app startup) stays cheap
+        from motor.motor_asyncio import AsyncIOMotorClient
+
+        _async_client = AsyncIOMotorClient(database_url)
+        _async_db = _async_client[database_name]
+    return _async_db
+
+
+async def aggregate_documents_async(collection_name: str, pipeline: List[dict]):
+    """Run an aggregation pipeline and return the resulting documents (non-blocking)"""
+    adb = get_async_db()
+    if adb is None:
+        raise Exception("Database not available. Check DATABASE_URL and DATABASE_NAME environment variables.")
+
+    return await adb[collection_name].aggregate(pipeline).to_list(length=None)
+
+
+class DocumentBatcher:
+    """
+    Fire-and-forget writer for non-critical documents.
+
+    submit() assigns the _id client-side and returns immediately; a background
+    task collects documents for up to max_delay seconds (or max_batch docs)
+    and writes them with a single insert_many. The id returned by submit()
+    is not durable until on_flushed has been called with its document;
+    on_failed is called instead for documents that could not be written.
+
+    At most max_queued documents wait for a flush; beyond that submit()
+    raises asyncio.QueueFull so callers can shed load instead of piling up
+    ids that may never be written.
+    """
+
+    def __init__(
+        self,
+        collection_name: str,
+        max_batch: int = 100,
+        max_delay: float = 0.05,
+        max_queued: int = 1000,
+        on_flushed: Optional[Callable[[List[dict]], None]] = None,
+        on_failed: Optional[Callable[[List[dict]], None]] = None,
+    ):
+        self.collection_name = collection_name
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.max_queued = max_queued
+        self.on_flushed = on_flushed
+        self.on_failed = on_failed
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._batch: List[dict] = []
+
+    def start(self):
+        """Start the flush loop on the running event loop"""
+        if self._task is None:
+            self._queue = asyncio.Queue(maxsize=self.max_queued)
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self, timeout: float = 10.0):
+        """Flush what's queued (for at most timeout seconds) and stop the flush loop"""
+        if self._task is None:
+            return
+        try:
+            await asyncio.wait_for(self._drain(), timeout)
+        except asyncio.TimeoutError:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            dropped = len(self._batch) + self._queue.qsize()
+            logger.warning("Dropped %d queued %s documents at shutdown", dropped, self.collection_name)
+        self._batch = []
+        self._task = None
+        self._queue = None
+
+    async def _drain(self):
+        await self._queue.put(None)
+        # Shielded so a timeout in stop() decides whether the flush loop is cancelled
+        await asyncio.shield(self._task)
+
+    def submit(self, data: Union[BaseModel, dict]) -> str:
+        """Queue a single document with timestamp and return its id (raises asyncio.QueueFull when backed up)"""
+        if get_async_db() is None:
+            raise Exception("Database not available. Check DATABASE_URL and DATABASE_NAME environment variables.")
+        if self._queue is None:
+            raise RuntimeError("DocumentBatcher.start() must be called before submit()")
+
+        if isinstance(data, BaseModel):
+            data_dict = data.model_dump()
+        else:
+            data_dict = data.copy()
+
+        data_dict['_id'] = ObjectId()
+        data_dict['created_at'] = datetime.now(timezone.utc)
+        data_dict['updated_at'] = datetime.now(timezone.utc)
+
+        self._queue.put_nowait(data_dict)
+        return str(data_dict['_id'])
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            doc = await self._queue.get()
+            if doc is None:
+                return
+            batch = self._batch = [doc]
+            deadline = loop.time() + self.max_delay
+            stopping = False
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    doc = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if doc is None:
+                    stopping = True
+                    break
+                batch.append(doc)
+            await self._flush(batch)
+            self._batch = []
+            if stopping:
+                return
+
+    async def _flush(self, batch: List[dict]):
+        stored, dropped = batch, []
+        try:
+            await get_async_db()[self.collection_name].insert_many(batch, ordered=False)
+        except BulkWriteError as e:
+            # Unordered inserts keep going past errors; report the ones that landed
+            failed = {err["index"] for err in e.details.get("writeErrors", [])}
+            stored = [doc for i, doc in enumerate(batch) if i not in failed]
+            dropped = [doc for i, doc in enumerate(batch) if i in failed]
+            logger.warning("Dropped %d %s documents: %s", len(dropped), self.collection_name, e)
+        except Exception as e:
+            # Nothing is waiting on this write, so log rather than propagate
+            stored, dropped = [], batch
+            logger.warning("Dropped %d %s documents: %s", len(dropped), self.collection_name, e)
+
+        self._notify("on_flushed", stored)
+        self._notify("on_failed", dropped)
+
+    def _notify(self, hook: str, docs: List[dict]):
+        callback = getattr(self, hook)
+        if not docs or callback is None:
+            return
+        try:
+            callback(docs)
+        except Exception:
+            # A broken callback must not take the flush loop down with it
+            logger.exception("%s callback failed for %d %s documents", hook, len(docs), self.collection_name)
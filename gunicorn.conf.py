@@ -0,0 +1,17 @@
+"""
+Gunicorn configuration for production
+
+Run with: gunicorn main:app -c gunicorn.conf.py
+WEB_CONCURRENCY sets the number of worker processes (defaults to one per CPU).
+"""
+
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', 8000)}"
+worker_class = "uvicorn.workers.UvicornWorker"
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+
+# Import the app once in the master so workers share its pages copy-on-write.
+# database.py creates its Mongo clients on first use, so each worker opens its own.
+preload_app = True
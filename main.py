@@ -1,23 +1,159 @@
+import asyncio
+import dataclasses
+import logging
 import os
-from datetime import date, datetime
-from typing import List, Optional
-
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from datetime import date
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+import orjson
+from bson import ObjectId
 from fastapi import FastAPI, HTTPException, Query
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel
+from pymongo import ASCENDING, DESCENDING
+
+from database import DocumentBatcher, aggregate_documents_async, get_async_db
+from schemas import HoroscopeReadingDC
+
+
+def _orjson_default(obj):
+    """Serialize the Mongo types orjson doesn't know about natively"""
+    if isinstance(obj, ObjectId):
+        return str(obj)
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+class MongoJSONResponse(ORJSONResponse):
+    """ORJSONResponse that can also encode raw Mongo documents"""
+
+    def render(self, content) -> bytes:
+        # pymongo hands back naive datetimes that are always UTC
+        return orjson.dumps(
+            content,
+            default=_orjson_default,
+            option=orjson.OPT_NAIVE_UTC,
+        )
+
+
+logger = logging.getLogger(__name__)
+
+
+async def _ensure_indexes():
+    """Create the indexes backing /api/horoscope lookups (no-op if they exist)"""
+    db = get_async_db()
+    if db is None:
+        return
+    try:
+        # The (sign, scope_date) prefix also serves sign-only queries
+        await db.horoscopereading.create_index([("sign", ASCENDING), ("scope_date", DESCENDING)])
+    except Exception as e:
+        logger.warning("Could not create horoscopereading indexes: %s", e)
+
+
+async def _check_database() -> dict:
+    """Probe the database and build the /test status payload"""
+    response = {
+        "backend": "✅ Running",
+        "database": "❌ Not Available",
+        "database_url": None,
+        "database_name": None,
+        "connection_status": "Not Connected",
+        "collections": []
+    }
+
+    try:
+        db = get_async_db()
+        if db is not None:
+            response["database"] = "✅ Available"
+            response["database_url"] = "✅ Configured"
+            response["database_name"] = db.name if hasattr(db, 'name') else "✅ Connected"
+            response["connection_status"] = "Connected"
+
+            try:
+                collections = await db.list_collection_names()
+                response["collections"] = collections[:10]
+                response["database"] = "✅ Connected & Working"
+            except Exception as e:
+                response["database"] = f"⚠️  Connected but Error: {str(e)[:50]}"
+        else:
+            response["database"] = "⚠️  Available but not initialized"
+
+    except Exception as e:
+        response["database"] = f"❌ Error: {str(e)[:50]}"
+
+    response["database_url"] = "✅ Set" if os.getenv("DATABASE_URL") else "❌ Not Set"
+    response["database_name"] = "✅ Set" if os.getenv("DATABASE_NAME") else "❌ Not Set"
+
+    return response
+
+
+# Last /test payload; refreshed in the background so polling never waits on Mongo
+_HEALTH_INTERVAL = 5.0
+_health_cache = {"data": None, "refresh": None}
+
+
+async def _store_health() -> dict:
+    data = await _check_database()
+    _health_cache["data"] = data
+    return data
 
-from database import db, create_document, get_documents
-from schemas import HoroscopeReading
 
-app = FastAPI(title="Futuristic Horoscope API", version="1.0.0")
+async def _refresh_health() -> dict:
+    """Probe the database, joining the in-flight probe if there is one"""
+    refresh = _health_cache["refresh"]
+    if refresh is None or refresh.done():
+        refresh = _health_cache["refresh"] = asyncio.create_task(_store_health())
+    # Shielded so a cancelled caller doesn't cancel the probe for everyone else
+    return await asyncio.shield(refresh)
+
+
+async def _refresh_health_loop():
+    while True:
+        await _refresh_health()
+        await asyncio.sleep(_HEALTH_INTERVAL)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Not awaited: an unreachable Mongo must not hold up serving / and /test
+    index_task = asyncio.create_task(_ensure_indexes())
+    _reading_writer.start()
+    health_task = asyncio.create_task(_refresh_health_loop())
+    yield
+    health_task.cancel()
+    index_task.cancel()
+    refresh = _health_cache["refresh"]
+    if refresh is not None:
+        refresh.cancel()
+    await asyncio.gather(health_task, index_task, return_exceptions=True)
+    await _reading_writer.stop()
+
+
+app = FastAPI(
+    title="Futuristic Horoscope API",
+    version="1.0.0",
+    default_response_class=MongoJSONResponse,
+    lifespan=lifespan,
+)
+
+# Comma-separated allowlist, e.g. "https://app.example.com,https://staging.example.com".
+# No cookies are used, so credentials stay off and "*" is a valid default.
+CORS_ORIGINS = [o.strip() for o in os.getenv("CORS_ORIGINS", "*").split(",") if o.strip()]
 
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+    allow_origins=CORS_ORIGINS,
+    allow_credentials=False,
+    allow_methods=["GET", "POST"],
+    allow_headers=["content-type"],
 )
+# Added last so it wraps CORS; bodies under 500 bytes are sent uncompressed
+app.add_middleware(GZipMiddleware, minimum_size=500, compresslevel=5)
 
 
 class GenerateRequest(BaseModel):
@@ -25,90 +161,91 @@ class GenerateRequest(BaseModel):
     scope_date: Optional[date] = None
 
 
-ZODIAC_SIGNS = {
+ZODIAC_SIGNS = frozenset({
     "aries", "taurus", "gemini", "cancer", "leo", "virgo",
     "libra", "scorpio", "sagittarius", "capricorn", "aquarius", "pisces"
-}
-
-
-@app.get("/")
-def read_root():
-    return {"message": "Futuristic Horoscope Backend is live"}
+})
 
+_SIGN_SEED = {s: sum(map(ord, s)) for s in ZODIAC_SIGNS}
 
-@app.get("/api/horoscope")
-def get_horoscope(sign: str = Query(..., description="Zodiac sign"), scope_date: Optional[date] = None):
-    """Fetch stored horoscope(s) for a sign and optional date."""
-    if sign.lower() not in ZODIAC_SIGNS:
-        raise HTTPException(status_code=400, detail="Invalid zodiac sign")
+# Generation vocabularies, built once instead of on every request
+_MOODS = (
+    "radiant", "introspective", "bold", "curious", "grounded", "electric",
+    "serene", "magnetic", "fearless", "visionary", "playful", "resolute"
+)
+_COLORS = (
+    "iridescent violet", "neon cyan", "plasma pink", "midnight indigo",
+    "quantum gold", "holographic silver", "aurora teal", "cosmic amber"
+)
+_HEADLINES = (
+    "Orbit your potential.", "Align with the signal.", "Rewrite today’s script.",
+    "Touch the ribbon of fate.", "Navigate the unknown.", "Spark a new circuit."
+)
+_KEYWORDS = (
+    "sync", "flow", "impulse", "clarity", "bridge", "pulse", "echo", "vector",
+    "harmony", "signal", "orbit", "ribbon", "thrive", "link", "spark"
+)
+# Sorted so compatibility picks don't depend on set iteration order
+_COMPATS = tuple(sorted(ZODIAC_SIGNS))
+
+_LEN_MOODS = len(_MOODS)
+_LEN_COLORS = len(_COLORS)
+_LEN_HEADLINES = len(_HEADLINES)
+_LEN_KEYWORDS = len(_KEYWORDS)
+_LEN_COMPATS = len(_COMPATS)
+
+_DESC_TEMPLATE = (
+    "Today, {Sign} tunes into a {mood} frequency."
+    " Signals you’ve been waiting on begin to resolve, forming patterns in plain sight."
+    " Trust your calibration and take one deliberate step forward."
+    " A chance encounter amplifies your intention—listen for echoes."
+)
 
-    filt = {"sign": sign.lower()}
-    if scope_date:
-        # Pydantic stores date as datetime/date; our helper returns raw dicts
-        filt["scope_date"] = scope_date
+# Fields returned by /api/horoscope, with _id exposed as a string "id";
+# anything else stays on the server
+_READING_PROJECTION = {
+    "_id": 0, "sign": 1, "scope_date": 1, "headline": 1, "description": 1,
+    "mood": 1, "lucky_number": 1, "lucky_color": 1, "keywords": 1, "compatibility": 1,
+    "id": {"$toString": "$_id"},
+}
 
-    docs = get_documents("horoscopereading", filt, limit=10)
-    # Convert ObjectId and dates to string-safe outputs
-    def normalize(doc):
-        d = dict(doc)
-        if "_id" in d:
-            d["id"] = str(d.pop("_id"))
-        if isinstance(d.get("scope_date"), (datetime, date)):
-            d["scope_date"] = str(d["scope_date"])[:10]
-        return d
 
-    return {"results": [normalize(x) for x in docs]}
+def _validate_sign(sign: str) -> str:
+    """Return the canonical (lowercase) sign or raise a 400"""
+    # Most clients already send lowercase, so try that before allocating
+    if sign in ZODIAC_SIGNS:
+        return sign
+    s = sign.lower()
+    if s not in ZODIAC_SIGNS:
+        raise HTTPException(status_code=400, detail="Invalid zodiac sign")
+    return s
 
 
-@app.post("/api/horoscope/generate")
-def generate_and_store(req: GenerateRequest):
-    """
-    Generate a fresh horoscope-like reading (rule-based pseudo generation)
-    and store it in the database for persistence.
-    """
-    sign = req.sign.lower()
-    if sign not in ZODIAC_SIGNS:
-        raise HTTPException(status_code=400, detail="Invalid zodiac sign")
+@lru_cache(maxsize=12)
+def _title(sign: str) -> str:
+    return sign.title()
 
-    d = req.scope_date or date.today()
 
-    # Simple deterministic pseudo-generation based on sign + date hash
-    seed = sum(ord(c) for c in (sign + d.isoformat()))
-    moods = [
-        "radiant", "introspective", "bold", "curious", "grounded", "electric",
-        "serene", "magnetic", "fearless", "visionary", "playful", "resolute"
-    ]
-    colors = [
-        "iridescent violet", "neon cyan", "plasma pink", "midnight indigo",
-        "quantum gold", "holographic silver", "aurora teal", "cosmic amber"
-    ]
-    headlines = [
-        "Orbit your potential.", "Align with the signal.", "Rewrite today’s script.",
-        "Touch the ribbon of fate.", "Navigate the unknown.", "Spark a new circuit."
-    ]
-    keywords_pool = [
-        "sync", "flow", "impulse", "clarity", "bridge", "pulse", "echo", "vector",
-        "harmony", "signal", "orbit", "ribbon", "thrive", "link", "spark"
-    ]
-    compats = list(ZODIAC_SIGNS)
-
-    mood = moods[seed % len(moods)]
-    color = colors[seed % len(colors)]
-    headline = headlines[seed % len(headlines)]
+@lru_cache(maxsize=512)
+def _build_reading(sign: str, d: date) -> HoroscopeReadingDC:
+    """Rule-based reading for a sign and date; pure, so safe to memoize"""
+    # Simple deterministic pseudo-generation: Knuth multiplicative hash of
+    # the sign mixed with the date's ordinal
+    seed = (_SIGN_SEED[sign] * 2654435761 ^ d.toordinal()) & 0xFFFFFFFF
+    mood = _MOODS[seed % _LEN_MOODS]
+    color = _COLORS[seed % _LEN_COLORS]
+    headline = _HEADLINES[seed % _LEN_HEADLINES]
     lucky_number = (seed % 99) + 1
-    compatibility = compats[seed % len(compats)]
+    compatibility = _COMPATS[seed % _LEN_COMPATS]
     # Ensure compatibility not equal to the sign for variety
     if compatibility == sign:
-        compatibility = compats[(seed + 3) % len(compats)]
+        compatibility = _COMPATS[(seed + 3) % _LEN_COMPATS]
+    k0, k1, k2 = seed % _LEN_KEYWORDS, (seed + 1) % _LEN_KEYWORDS, (seed + 2) % _LEN_KEYWORDS
 
-    description = (
-        f"Today, {sign.title()} tunes into a {mood} frequency."
-        f" Signals you’ve been waiting on begin to resolve, forming patterns in plain sight."
-        f" Trust your calibration and take one deliberate step forward."
-        f" A chance encounter amplifies your intention—listen for echoes."
-    )
+    description = _DESC_TEMPLATE.format_map({"Sign": _title(sign), "mood": mood})
 
-    reading = HoroscopeReading(
+    # Values are server-built and already well-typed, so skip pydantic validation
+    return HoroscopeReadingDC(
         sign=sign,
         scope_date=d,
         headline=headline,
@@ -116,57 +253,123 @@ def generate_and_store(req: GenerateRequest):
         mood=mood,
         lucky_number=lucky_number,
         lucky_color=color,
-        keywords=[keywords_pool[(seed + i) % len(keywords_pool)] for i in range(3)],
+        keywords=(_KEYWORDS[k0], _KEYWORDS[k1], _KEYWORDS[k2]),
         compatibility=compatibility,
     )
 
-    inserted_id = create_document("horoscopereading", reading)
 
-    return {
-        "id": inserted_id,
-        "reading": reading.model_dump()
-    }
+# Ids of readings this process has confirmed stored, keyed by (sign, ISO
+# scope_date). Bounded LRU, since clients choose the dates.
+_PERSISTED_MAX = 4096
+_persisted: "OrderedDict[Tuple[str, str], str]" = OrderedDict()
+# Ids submitted to the writer but not flushed yet, so concurrent repeats share
+# one document; bounded by the writer's queue. Each worker process keeps its
+# own maps, so with several workers a reading may be stored once per worker.
+_pending: Dict[Tuple[str, str], str] = {}
 
 
-@app.get("/test")
-def test_database():
-    """Test endpoint to check if database is available and accessible"""
-    response = {
-        "backend": "✅ Running",
-        "database": "❌ Not Available",
-        "database_url": None,
-        "database_name": None,
-        "connection_status": "Not Connected",
-        "collections": []
-    }
+def _record_persisted(docs: List[dict]):
+    """DocumentBatcher callback: remember ids once their insert succeeded"""
+    for doc in docs:
+        key = (doc["sign"], doc["scope_date"])
+        _pending.pop(key, None)
+        _persisted[key] = str(doc["_id"])
+        _persisted.move_to_end(key)
+    while len(_persisted) > _PERSISTED_MAX:
+        _persisted.popitem(last=False)
 
-    try:
-        if db is not None:
-            response["database"] = "✅ Available"
-            response["database_url"] = "✅ Configured"
-            response["database_name"] = db.name if hasattr(db, 'name') else "✅ Connected"
-            response["connection_status"] = "Connected"
 
-            try:
-                collections = db.list_collection_names()
-                response["collections"] = collections[:10]
-                response["database"] = "✅ Connected & Working"
-            except Exception as e:
-                response["database"] = f"⚠️  Connected but Error: {str(e)[:50]}"
-        else:
-            response["database"] = "⚠️  Available but not initialized"
+def _forget_pending(docs: List[dict]):
+    """DocumentBatcher callback: let the next request retry a failed insert"""
+    for doc in docs:
+        _pending.pop((doc["sign"], doc["scope_date"]), None)
 
-    except Exception as e:
-        response["database"] = f"❌ Error: {str(e)[:50]}"
 
-    import os as _os
-    response["database_url"] = "✅ Set" if _os.getenv("DATABASE_URL") else "❌ Not Set"
-    response["database_name"] = "✅ Set" if _os.getenv("DATABASE_NAME") else "❌ Not Set"
+# Generated readings are reproducible, so their writes don't need to block responses
+_reading_writer = DocumentBatcher(
+    "horoscopereading",
+    on_flushed=_record_persisted,
+    on_failed=_forget_pending,
+)
+
+
+@app.get("/")
+async def read_root():
+    return {"message": "Futuristic Horoscope Backend is live"}
+
+
+@app.get("/api/horoscope", response_model=None)
+async def get_horoscope(sign: str = Query(..., description="Zodiac sign"), scope_date: Optional[date] = None):
+    """Fetch stored horoscope(s) for a sign and optional date."""
+    filt = {"sign": _validate_sign(sign)}
+    if scope_date:
+        # scope_date is persisted as an ISO string (BSON has no plain date type)
+        filt["scope_date"] = scope_date.isoformat()
+
+    docs = await aggregate_documents_async("horoscopereading", [
+        {"$match": filt},
+        {"$limit": 10},
+        {"$project": _READING_PROJECTION},
+    ])
+
+    # Documents are already response-shaped, so hand them straight to orjson
+    # instead of through FastAPI's jsonable_encoder
+    return MongoJSONResponse({"results": docs})
+
+
+@app.post("/api/horoscope/generate", response_model=None)
+async def generate_and_store(req: GenerateRequest):
+    """
+    Generate a fresh horoscope-like reading (rule-based pseudo generation)
+    and store it in the database for persistence.
+    """
+    sign = _validate_sign(req.sign)
+
+    d = req.scope_date or date.today()
+    reading = _build_reading(sign, d)
+
+    # Readings are deterministic, so each (sign, date) only needs storing once
+    key = (sign, d.isoformat())
+    inserted_id = _persisted.get(key)
+    if inserted_id is not None:
+        _persisted.move_to_end(key)
+    else:
+        inserted_id = _pending.get(key)
+    if inserted_id is None:
+        # scope_date is persisted as an ISO string (BSON has no plain date type)
+        doc = dataclasses.asdict(reading)
+        doc["scope_date"] = key[1]
+        try:
+            inserted_id = _reading_writer.submit(doc)
+        except asyncio.QueueFull:
+            # The database isn't keeping up; don't hand out ids that may never exist
+            raise HTTPException(status_code=503, detail="Storage is busy, please retry")
+        _pending[key] = inserted_id
+
+    # orjson encodes the dataclass natively, so there's no asdict() pass here
+    # and no FastAPI jsonable_encoder/serialization pass either
+    return MongoJSONResponse({"id": inserted_id, "reading": reading})
 
-    return response
+
+@app.get("/test")
+async def test_database():
+    """Test endpoint to check if database is available and accessible"""
+    # Serve the latest snapshot, however old; only probe inline before the first one
+    data = _health_cache["data"]
+    if data is not None:
+        return data
+    return await _refresh_health()
 
 
 if __name__ == "__main__":
     import uvicorn
     port = int(os.getenv("PORT", 8000))
-    uvicorn.run(app, host="0.0.0.0", port=port)
+    # uvicorn needs an import string (not the app object) to spawn workers
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        port=port,
+        loop="uvloop",
+        http="httptools",
+        workers=int(os.getenv("WEB_CONCURRENCY", 1)),
+    )
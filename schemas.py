@@ -11,8 +11,9 @@ Model name is converted to lowercase for the collection name:
 - BlogPost -> "blogs" collection
 """
 
+from dataclasses import dataclass
 from pydantic import BaseModel, Field
-from typing import Optional, List
+from typing import Optional, List, Tuple
 from datetime import date
 
 # Example schemas (replace with your own):
@@ -56,3 +57,20 @@ class HoroscopeReading(BaseModel):
     lucky_color: str = Field(..., description="Lucky color suggestion")
     keywords: List[str] = Field(default_factory=list, description="Keyword tags for the reading")
     compatibility: Optional[str] = Field(None, description="Best compatible sign today")
+
+
+@dataclass(slots=True, frozen=True)
+class HoroscopeReadingDC:
+    """
+    Unvalidated mirror of HoroscopeReading for server-built readings
+    Collection name: "horoscopereading"
+    """
+    sign: str
+    scope_date: date
+    headline: str
+    description: str
+    mood: str
+    lucky_number: int
+    lucky_color: str
+    keywords: Tuple[str, ...] = ()
+    compatibility: Optional[str] = None